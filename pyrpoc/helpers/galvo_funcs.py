@@ -36,6 +36,16 @@ class Galvo:
             self.waveform = None  # or maybe generate it here...
         else:
             self.waveform = self.gen_raster()
+            self.waveform.setflags(write=False) # handed straight to the daq every frame, nothing should modify it in place
+
+        self.ai_buffer = None
+
+    def get_ai_buffer(self, num_channels):
+        # daq read buffer that lives as long as this galvo (i.e. until the scan geometry changes), reused every frame
+        shape = (num_channels, self.total_samples)
+        if self.ai_buffer is None or self.ai_buffer.shape != shape:
+            self.ai_buffer = np.empty(shape, dtype=np.float64)
+        return self.ai_buffer
 
     def gen_raster(self):
         contained_rowsamples = self.pixel_samples * self.numsteps_x
@@ -71,7 +81,7 @@ class Galvo:
         return composite
 
 
-    def gen_variable_waveform(self, mask, dwell_multiplier):
+    def gen_variable_waveform(self, mask, dwell_multiplier, out=None):
         dwell = self.dwell
         rate = self.rate
         num_y = self.numsteps_y
@@ -93,28 +103,23 @@ class Galvo:
                                 self.offset_y - self.amp_y,
                                 num_y)
 
-        x_wave_list = []
-        y_wave_list = []
-        pixel_map = np.zeros((num_y, num_x), dtype=int)
-
-        for row_idx in range(num_y):
-            row_y = y_positions[row_idx]
-            for col_idx in range(num_x):
-                if col_idx < self.extrasteps_left or col_idx >= (num_x - self.extrasteps_right): # for clarity im leaving this out of the else - we need to remember to account for extrasteps here
-                    this_dwell = dwell_off
-                elif mask[row_idx, col_idx - self.extrasteps_left]:
-                    this_dwell = dwell_on
-                else:
-                    this_dwell = dwell_off
-
-                pixel_samps = max(1, int(this_dwell * rate))
-
-                x_val = x_positions[col_idx]
-                x_wave_list.append(np.full(pixel_samps, x_val))
-
-                y_wave_list.append(np.full(pixel_samps, row_y))
-
-                pixel_map[row_idx, col_idx] = pixel_samps
-        x_wave = np.concatenate(x_wave_list)
-        y_wave = np.concatenate(y_wave_list)
-        return x_wave, y_wave, pixel_map
+        # samples per pixel, extrasteps columns are always dwell_off
+        samps_on = max(1, int(dwell_on * rate))
+        samps_off = max(1, int(dwell_off * rate))
+        pixel_map = np.full((num_y, num_x), samps_off, dtype=int)
+        inner = pixel_map[:, self.extrasteps_left:num_x - self.extrasteps_right]
+        inner[np.asarray(mask, dtype=bool)] = samps_on
+
+        # x and y written straight into the rows of one (2, N) array that can go to the ao task as is, no vstack.
+        # fresh each call so a returned waveform is never overwritten later; pass out= to reuse your own buffer
+        total_samps = int(pixel_map.sum())
+        if out is None:
+            out = np.empty((2, total_samps), dtype=np.float64)
+        out[0] = np.repeat(np.tile(x_positions, num_y), pixel_map.ravel())
+        out[1] = np.repeat(y_positions, pixel_map.sum(axis=1))
+        x_wave, y_wave = out[0], out[1]
+
+        # where each pixel's samples begin, so interpret_DAQ_output doesnt have to redo the cumsum every scan
+        pixel_starts = np.zeros(pixel_map.size, dtype=np.intp)
+        np.cumsum(pixel_map.ravel()[:-1], out=pixel_starts[1:])
+        return x_wave, y_wave, pixel_map, pixel_starts
@@ -1,21 +1,74 @@
 import nidaqmx
 from nidaqmx.constants import AcquisitionType, LineGrouping
 from nidaqmx.errors import DaqWarning
+from nidaqmx.stream_readers import AnalogMultiChannelReader
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from pyrpoc.helpers.galvo_funcs import Galvo
 import matplotlib.pyplot as plt
-from PIL import Image, ImageTk, ImageDraw, ImageOps
+from PIL import ImageTk, ImageDraw, ImageOps
 import warnings
 warnings.filterwarnings("ignore", category=DaqWarning, message=".*200011.*")
 
-def run_scan(ai_channels, galvo, modulate=False, mod_do_chans=None, mod_masks=None):
+ao_pool = ThreadPoolExecutor(max_workers=1)
+
+TTL_CACHE_SIZE = 8
+ttl_cache = {} # (mask contents, scan geometry) -> expanded ttl, live preview rescans the same masks every frame
+
+def build_ttl(m, galvo):
+    m_arr = np.asarray(m)
+    if m_arr.dtype != np.bool_: # bool masks (script masks) are already on/off, no need for another full-size copy
+        m_arr = m_arr > 0 # pretty sure that its a unint8, could be 0 to 1 as well so to be safe just > 0
+    key = (m_arr.shape, m_arr.tobytes(), galvo.numsteps_y, galvo.numsteps_x,
+           galvo.extrasteps_left, galvo.extrasteps_right, galvo.pixel_samples)
+    flat = ttl_cache.get(key)
+    if flat is not None:
+        return flat
+
+    # written straight into the output through a (y, total_x, pixel_samples) view, no padded intermediate.
+    # mask goes in the middle, the extrasteps columns on either side stay off, each pixel's bit held for pixel_samples ticks
+    x0, x1 = galvo.extrasteps_left, galvo.extrasteps_left + galvo.numsteps_x
+    flat = np.empty(galvo.numsteps_y * galvo.total_x * galvo.pixel_samples, dtype=bool)
+    ticks = flat.reshape(galvo.numsteps_y, galvo.total_x, galvo.pixel_samples)
+    ticks[:, :x0] = False
+    ticks[:, x1:] = False
+    ticks[:, x0:x1] = m_arr[:galvo.numsteps_y, :, None]
+    flat.setflags(write=False) # shared between scans now
+
+    if len(ttl_cache) >= TTL_CACHE_SIZE:
+        ttl_cache.pop(next(iter(ttl_cache))) # drop the oldest
+    ttl_cache[key] = flat
+    return flat
+
+def port_line(chan):
+    # 'port0/line5' -> ('port0', 5), None for anything that isnt a single line
+    port, _, line = chan.partition('/')
+    if not port.startswith('port') or not line.startswith('line') or not line[4:].isdigit():
+        return None
+    return port, int(line[4:])
+
+def pack_ttl_lines(mod_do_chans, ttl_signals):
+    # several lines on one port -> one uint32 sample per tick with each line at its own bit, instead of one bool array per line.
+    # returns None if the lines arent all plain lines on the same port, caller falls back to per-line bools
+    lines = [port_line(chan) for chan in mod_do_chans]
+    if len(lines) < 2 or None in lines or len({port for port, _ in lines}) != 1 or len({l for _, l in lines}) != len(lines):
+        return None
+    packed = np.zeros(ttl_signals[0].size, dtype=np.uint32)
+    bits = np.empty_like(packed)
+    for (_, line), ttl in zip(lines, ttl_signals):
+        np.left_shift(ttl, line, out=bits, dtype=np.uint32)
+        packed |= bits
+    return packed
+
+def run_scan(ai_channels, galvo, modulate=False, mod_do_chans=None, mod_masks=None, before_start=None):
     if isinstance(ai_channels, str):
         ai_channels = [ai_channels]
 
     has_mods = modulate and mod_do_chans and mod_masks and (len(mod_do_chans) == len(mod_masks))
     
-    composite_wave = galvo.waveform.copy()
+    composite_wave = galvo.waveform # write only reads from it, no need for a per-frame copy
     total_samps = galvo.total_samples
+    ai_buffer = galvo.get_ai_buffer(len(ai_channels))
 
     with nidaqmx.Task() as ao_task, nidaqmx.Task() as ai_task, nidaqmx.Task() as do_task:
         for chan in galvo.ao_chans:
@@ -28,52 +81,47 @@ def run_scan(ai_channels, galvo, modulate=False, mod_do_chans=None, mod_masks=No
             sample_mode=AcquisitionType.FINITE,
             samps_per_chan=total_samps
         )
-        ai_task.timing.cfg_samp_clk_timing(
+        # ai and do both run off the ao sample clock with the same sample count
+        follower_timing = dict(
             rate=galvo.rate,
             source=f"/{galvo.device}/ao/SampleClock",
             sample_mode=AcquisitionType.FINITE,
             samps_per_chan=total_samps
         )
+        ai_task.timing.cfg_samp_clk_timing(**follower_timing)
 
         if has_mods:
-            ttl_signals = []
-            for m in mod_masks:
-                m_arr = np.array(m) if isinstance(m, Image.Image) else m
-                m_arr = m_arr > 0 # pretty sure that its a unint8, could be 0 to 1 as well so to be safe just > 0
-                padded = []
-                for row in range(galvo.numsteps_y):
-                    padded_row = np.concatenate((
-                        np.zeros(galvo.extrasteps_left, dtype=bool),
-                        m_arr[row, :],
-                        np.zeros(galvo.extrasteps_right, dtype=bool)
-                    ))
-                    padded.append(padded_row)
-                flat = np.repeat(np.array(padded).ravel(), galvo.pixel_samples).astype(bool)
-                ttl_signals.append(flat)
-            
-            if len(mod_do_chans) == 1:
-                line = mod_do_chans[0]
-                do_task.do_channels.add_do_chan(f"{galvo.device}/{line}")
-                do_task.timing.cfg_samp_clk_timing(
-                    rate=galvo.rate,
-                    source=f"/{galvo.device}/ao/SampleClock",
-                    sample_mode=AcquisitionType.FINITE,
-                    samps_per_chan=total_samps
-                )
-                do_task.write(ttl_signals[0].tolist(), auto_start=False)
-            else:
-                for chan in mod_do_chans:
-                    do_task.do_channels.add_do_chan(f"{galvo.device}/{chan}")
-                do_task.timing.cfg_samp_clk_timing(
-                    rate=galvo.rate,
-                    source=f"/{galvo.device}/ao/SampleClock",
-                    sample_mode=AcquisitionType.FINITE,
-                    samps_per_chan=total_samps
-                )
-                data_to_write = [sig.tolist() for sig in ttl_signals]
-                do_task.write(data_to_write, auto_start=False)
-
-        ao_task.write(composite_wave, auto_start=False)
+            # the ao buffer write is a driver call that releases the gil, let it run while the ttl masks get built and written
+            ao_write = ao_pool.submit(ao_task.write, composite_wave, auto_start=False)
+            try:
+                ttl_signals = [build_ttl(m, galvo) for m in mod_masks]
+
+                packed = pack_ttl_lines(mod_do_chans, ttl_signals)
+                if packed is not None:
+                    # one channel over just these lines, data bits line up with the line numbers on the port
+                    do_task.do_channels.add_do_chan(
+                        ",".join(f"{galvo.device}/{chan}" for chan in mod_do_chans),
+                        line_grouping=LineGrouping.CHAN_FOR_ALL_LINES
+                    )
+                else:
+                    for chan in mod_do_chans:
+                        do_task.do_channels.add_do_chan(f"{galvo.device}/{chan}")
+                do_task.timing.cfg_samp_clk_timing(**follower_timing)
+                # ndarrays go straight to the driver, no python list of millions of bools
+                if packed is not None:
+                    do_task.write(packed, auto_start=False)
+                elif len(ttl_signals) == 1:
+                    do_task.write(ttl_signals[0], auto_start=False)
+                else:
+                    do_task.write(np.stack(ttl_signals), auto_start=False)
+            except BaseException:
+                ao_write.exception() # the write has to land before the tasks close, but the do error is the one to report
+                raise
+            ao_write.result()
+        else:
+            ao_task.write(composite_wave, auto_start=False)
+        if before_start is not None:
+            before_start() # e.g. wait for a stage to settle, the task setup above overlaps with the move
         ai_task.start()
         if has_mods:
             do_task.start()
@@ -84,27 +132,30 @@ def run_scan(ai_channels, galvo, modulate=False, mod_do_chans=None, mod_masks=No
         if has_mods:
             do_task.wait_until_done(timeout=total_samps / galvo.rate + 5)
 
-        acq_data = np.array(ai_task.read(number_of_samples_per_channel=total_samps))
+        # read straight into the caller's buffer instead of letting nidaqmx build a fresh list every frame
+        reader = AnalogMultiChannelReader(ai_task.in_stream)
+        reader.read_many_sample(ai_buffer, number_of_samples_per_channel=total_samps, timeout=5)
 
-    results = []
-    for i in range(len(ai_channels)):
-        channel_data = acq_data if len(ai_channels) == 1 else acq_data[i]
-        reshaped = channel_data.reshape(galvo.total_y, galvo.total_x, galvo.pixel_samples)
-        pixel_values = np.mean(reshaped, axis=2)
-        cropped = pixel_values[:, galvo.extrasteps_left:galvo.extrasteps_left + galvo.numsteps_x]
-        results.append(cropped)
+    # per-pixel average as a plain sum into one output block, then a single multiply by 1/pixel_samples for every channel.
+    # the extrasteps columns are sliced off before reducing so their samples are never summed
+    x0, x1 = galvo.extrasteps_left, galvo.extrasteps_left + galvo.numsteps_x
+    pixel_values = np.empty((len(ai_channels), galvo.total_y, galvo.numsteps_x), dtype=np.float64)
+    samples = ai_buffer.reshape(len(ai_channels), galvo.total_y, galvo.total_x, galvo.pixel_samples) # view, no copy
+    np.add.reduce(samples[:, :, x0:x1, :], axis=3, out=pixel_values)
+    pixel_values *= 1.0 / galvo.pixel_samples
 
-    return results
+    return list(pixel_values)
 
 
-def interpret_DAQ_output(ai_data_1d, mask, pixel_map, galvo):
+def interpret_DAQ_output(ai_data_1d, mask, pixel_map, galvo, pixel_starts=None):
+    # pixels have variable sample counts (pixel_map), samples are laid out back to back in scan order.
+    # one reduceat over the block starts sums every pixel at once, then divide by each pixel's count
     num_y, total_x = pixel_map.shape
-    pixel_values_2d = np.zeros((num_y, total_x), dtype=float)
-    cursor = 0
-    for row_idx in range(num_y):
-        for col_idx in range(total_x):
-            samps = pixel_map[row_idx, col_idx]
-            pixel_block = ai_data_1d[cursor:cursor + samps]
-            cursor += samps
-            pixel_values_2d[row_idx, col_idx] = np.mean(pixel_block)
-    return pixel_values_2d
\ No newline at end of file
+    lengths = pixel_map.ravel()
+    starts = pixel_starts # from gen_variable_waveform, only rebuilt here if the caller didnt keep them
+    if starts is None:
+        starts = np.zeros(lengths.size, dtype=np.intp)
+        np.cumsum(lengths[:-1], out=starts[1:])
+    sums = np.add.reduceat(ai_data_1d[:starts[-1] + lengths[-1]], starts)
+    pixel_values_2d = (sums / lengths).reshape(num_y, total_x)
+    return pixel_values_2d
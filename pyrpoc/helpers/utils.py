@@ -1,6 +1,5 @@
 import tkinter as tk
 import numpy as np
-from PIL import Image
 
 class Tooltip:
     def __init__(self, widget, text):
@@ -51,6 +50,7 @@ class Tooltip:
 def generate_data(num_channels=1, config=None):
     nx = config.get('numsteps_x', 200) if config else 200
     ny = config.get('numsteps_y', 200) if config else 200
+    ys, xs = np.ogrid[:ny, :nx] # broadcast against each other, no per-pixel python loop
     data_list = []
     for ch in range(num_channels):
         arr = np.random.uniform(0, 0.1, size=(ny, nx))
@@ -62,20 +62,19 @@ def generate_data(num_channels=1, config=None):
         eye_radius = radius // 8
         mouth_radius = radius // 2
         mouth_thickness = 2
-        for x in range(nx):
-            for y in range(ny):
-                if ((x - (center_x - eye_offset))**2 + (y - (center_y + eye_offset))**2) < eye_radius**2:
-                    arr[y, x] = 1.0
-                if ((x - (center_x + eye_offset))**2 + (y - (center_y + eye_offset))**2) < eye_radius**2:
-                    arr[y, x] = 1.0
-                dist = ((x - center_x)**2 + (y - (center_y + eye_offset // 2))**2)**0.5
-                if mouth_radius - mouth_thickness < dist < mouth_radius + mouth_thickness and y < center_y:
-                    arr[y, x] = 1.0
+        left_eye = (xs - (center_x - eye_offset))**2 + (ys - (center_y + eye_offset))**2 < eye_radius**2
+        right_eye = (xs - (center_x + eye_offset))**2 + (ys - (center_y + eye_offset))**2 < eye_radius**2
+        dist = np.sqrt((xs - center_x)**2 + (ys - (center_y + eye_offset // 2))**2)
+        mouth = (mouth_radius - mouth_thickness < dist) & (dist < mouth_radius + mouth_thickness) & (ys < center_y)
+        arr[left_eye | right_eye | mouth] = 1.0
         data_list.append(arr)
     return data_list
 
-def convert(data, type_=np.uint8):
+def normalize(data, out=None, type_=np.uint8):
     data_flipped = np.flipud(data)
     arr_norm = (data_flipped - data_flipped.min()) / (data_flipped.max() - data_flipped.min() + 1e-9)
-    arr_typed = (arr_norm * 255).astype(type_)
-    return Image.fromarray(arr_typed)
\ No newline at end of file
+    arr_norm *= 255
+    if out is None:
+        return arr_norm.astype(type_)
+    out[...] = arr_norm # writes straight into a preallocated frame slot, no intermediate copy
+    return out
@@ -1,12 +1,16 @@
 import os
+import queue
+import functools
+import threading
 from tkinter import messagebox
-from pyrpoc.helpers.utils import generate_data, convert
-from pyrpoc.mains.display import display_data
+from pyrpoc.helpers.utils import generate_data, normalize
+from pyrpoc.mains.display import schedule_display
 from pyrpoc.helpers.galvo_funcs import Galvo
 from pyrpoc.helpers.run_image_2d import run_scan
 import pyrpoc.helpers.prior_stage.functions as prior
 from PIL import Image
 import numpy as np
+import tifffile
 
 def reset_gui(gui):
     gui.running = False
@@ -14,7 +18,38 @@ def reset_gui(gui):
     gui.continuous_button['state'] = 'normal'
     gui.single_button['state'] = 'normal'
     gui.stop_button['state'] = 'disabled'
-    gui.progress_label.config(text='(0/0)')
+    gui.tk_calls.put((gui.progress_var.set, ('(0/0)',))) # called from the acquisition thread, tk vars are only set on the tk thread
+
+GALVO_KEYS = (
+    'device', 'ao_chans', 'amp_x', 'amp_y', 'offset_x', 'offset_y', 'rate', 'dwell',
+    'numsteps_x', 'numsteps_y', 'extrasteps_left', 'extrasteps_right'
+)
+
+def get_galvo(gui):
+    # the raster waveform only depends on the scan geometry, so reuse it until one of those settings changes
+    key = tuple(tuple(v) if isinstance(v, list) else v for v in (gui.config.get(k) for k in GALVO_KEYS))
+    if gui.galvo_cache is None or gui.galvo_cache[0] != key:
+        gui.galvo_cache = (key, Galvo(gui.config))
+    return gui.galvo_cache[1]
+
+def convert_frames(ready_q, frames, errors, pool):
+    # consumer side of the acquisition pipeline, normalizes step i while the DAQ runs step i+1
+    while True:
+        item = ready_q.get()
+        if item is None:
+            return
+        i, data_list = item
+        try:
+            # channels are independent and numpy drops the gil for the heavy ops, so spread them over the pool
+            list(pool.map(normalize, data_list, frames[i]))
+        except Exception as e:
+            errors.append(e) # keep draining so the producer never blocks on a full queue
+
+def wait_for_saves(gui):
+    # one save in flight at a time, otherwise two saves could both pick the same unused filename
+    for future in gui.pending_saves:
+        future.result() # save_images reports its own errors
+    gui.pending_saves.clear()
 
 def acquire(gui, continuous=False, startup=False, auxilary=False, force_no_mask=False):
     if (gui.running or gui.acquiring) and not (startup or auxilary):
@@ -26,9 +61,15 @@ def acquire(gui, continuous=False, startup=False, auxilary=False, force_no_mask=
     gui.continuous_button['state'] = 'disabled'
     gui.single_button['state'] = 'disabled'
 
+    channels = None
+    scan, scan_key = None, None
     try:
+        wait_for_saves(gui)
         while gui.running if continuous else True:
             gui.update_config()
+            if channels is None or gui.config_dirty:
+                channels = [f"{gui.config['device']}/{ch}" for ch in gui.config['ai_chans']]
+                gui.config_dirty = False
 
             hyperspectral = gui.hyperspectral_enabled.get()
             zscan = gui.zscan_enabled.get()
@@ -39,7 +80,6 @@ def acquire(gui, continuous=False, startup=False, auxilary=False, force_no_mask=
 
             save = gui.save_acquisitions.get()
             filename = gui.save_file_entry.get().strip() if save else None
-            channels = [f"{gui.config['device']}/{ch}" for ch in gui.config['ai_chans']]
 
             if hyperspectral:
                 num_steps_entry = gui.entry_numshifts
@@ -67,7 +107,7 @@ def acquire(gui, continuous=False, startup=False, auxilary=False, force_no_mask=
                     gui.zaber_stage.connect()
                     start = float(gui.entry_start_um.get().strip())
                     stop = float(gui.entry_stop_um.get().strip())
-                    positions = [start + i * (stop - start) / (num_steps - 1) for i in range(num_steps)] if num_steps > 1 else [start]
+                    positions = np.linspace(start, stop, num_steps).tolist()
                 except Exception as e:
                     messagebox.showerror("Zaber Error", str(e))
                     break
@@ -78,32 +118,61 @@ def acquire(gui, continuous=False, startup=False, auxilary=False, force_no_mask=
                     prior.connect_prior(port)
                     start = int(10*float(gui.entry_z_start.get().strip())) # convert to 100s of nms, prior stage native units
                     stop = int(10*float(gui.entry_z_stop.get().strip()))
-                    positions = [start + i * (stop - start) / (num_steps - 1) for i in range(num_steps)] if num_steps > 1 else [start]
+                    positions = np.linspace(start, stop, num_steps).tolist()
                 except Exception as e:
                     messagebox.showerror("Prior Z-Stage Error", str(e))
                     break
 
-            images = []
-            for i in range(num_steps):
-                if not gui.acquiring:
-                    break
-
-                if hyperspectral:
-                    gui.zaber_stage.move_absolute_um(positions[i])
-                elif zscan:
-                    prior.move_z(port, int(positions[i]))
-
-                galvo = Galvo(gui.config)
-                data = acquire_single(gui, channels, galvo, force_no_mask=force_no_mask)
-                if data is None:
-                    break
-
-                images.append(data)
-                gui.progress_label.config(text=f'({i + 1}/{num_steps})')
-                gui.root.update_idletasks()
-
-            if save and images:
-                save_images(gui, images, filename)
+            num_acquired = 0
+            convert_errors = []
+            converter = None
+            if save:
+                # one preallocated (steps, channels, y, x) stack per acquisition, filled in place each step.
+                # live view only needs the display, so none of this is set up when nothing gets saved
+                frames = np.empty((num_steps, len(channels), gui.config['numsteps_y'], gui.config['numsteps_x']), dtype=np.uint8)
+                ready_q = queue.Queue(maxsize=2) # double buffered, the producer can run at most one step ahead
+                converter = threading.Thread(target=convert_frames, args=(ready_q, frames, convert_errors, gui.io_pool), daemon=True)
+                converter.start()
+            galvo = get_galvo(gui)
+            # only go back through the tk vars when one of them was touched (gui.params_dirty) or the scan setup changed
+            key = (galvo, tuple(channels), hyperspectral)
+            if scan is None or gui.params_dirty or key != scan_key:
+                gui.params_dirty = False
+                before_start = gui.zaber_stage.wait_until_idle if hyperspectral else None
+                scan = build_scan(gui, channels, galvo, force_no_mask=force_no_mask, before_start=before_start)
+                scan_key = key
+            progress_every = max(1, num_steps // 20) # ~20 label updates per stack regardless of its length
+            try:
+                for i in range(num_steps):
+                    if not gui.acquiring:
+                        break
+
+                    if hyperspectral:
+                        gui.zaber_stage.move_absolute_um(positions[i], wait=False) # the scan waits for idle once its tasks are armed
+                    elif zscan:
+                        prior.move_z(port, int(positions[i]))
+
+                    data = acquire_single(gui, scan)
+                    if data is None:
+                        break
+
+                    if converter is not None:
+                        ready_q.put((i, data))
+                    num_acquired += 1
+                    if (i + 1) % progress_every == 0 or i == num_steps - 1:
+                        gui.tk_calls.put((gui.progress_var.set, (f'({i + 1}/{num_steps})',)))
+            finally:
+                if converter is not None:
+                    ready_q.put(None)
+                    converter.join()
+
+            if convert_errors:
+                raise convert_errors[0]
+
+            if save and num_acquired:
+                # deflate + disk write happen on the save pool, in continuous mode they overlap the next stack's acquisition
+                wait_for_saves(gui)
+                gui.pending_saves.append(gui.save_pool.submit(save_images, gui, frames[:num_acquired], filename))
 
             if not continuous:
                 break
@@ -116,7 +185,75 @@ def acquire(gui, continuous=False, startup=False, auxilary=False, force_no_mask=
             reset_gui(gui)
 
 
-def acquire_single(gui, channels, galvo, move_z=None, force_no_mask=False):
+def simulated_scan(num_channels, config, before_start=None):
+    if before_start is not None:
+        before_start()
+    return generate_data(num_channels, config=config)
+
+def build_scan(gui, channels, galvo, force_no_mask=False, before_start=None):
+    # all the Tk variable reads happen here once per stack, each step then just calls the returned function
+    if gui.simulation_mode.get(): # :)
+        return functools.partial(simulated_scan, len(channels), gui.config, before_start=before_start)
+
+    if force_no_mask:
+        return functools.partial(run_scan, ai_channels=channels, galvo=galvo, modulate=False, before_start=before_start)
+
+    enabled = [i for i, var in enumerate(getattr(gui, 'mod_enabled_vars', [])) if var.get()]
+    ttl_chans = {i: gui.mod_ttl_channel_vars[i].get() for i in enabled}
+
+    mod_scripts = getattr(gui, 'mod_scripts', {})
+    scripts = {i: mod_scripts[i] for i in enabled if i in mod_scripts}
+    if scripts:
+        return functools.partial(scan_with_mask_scripts, gui, channels, galvo, scripts, ttl_chans, before_start)
+
+    mod_masks = getattr(gui, 'mod_masks', {})
+    mod_idx = [i for i in enabled if i in mod_masks]
+    return functools.partial(
+        run_scan,
+        ai_channels=channels,
+        galvo=galvo,
+        modulate=bool(mod_idx),
+        mod_do_chans=[ttl_chans[i] for i in mod_idx],
+        mod_masks=[mod_masks[i] for i in mod_idx],
+        before_start=before_start,
+    )
+
+
+def scan_with_mask_scripts(gui, channels, galvo, scripts, ttl_chans, before_start=None):
+    data_list = run_scan(
+        ai_channels=channels,
+        galvo=galvo,
+        modulate=False,
+        before_start=before_start,
+    )
+    converted = np.stack([normalize(d) for d in data_list])
+
+    # process the first acquisition
+    script_masks = {}
+    for i, script in scripts.items():
+        try:
+            mask_array = script(converted)
+            if mask_array.shape != converted[0].shape:
+                raise ValueError(f"Returned mask is the wrong size relative to input imgae shape. Input shape: {converted[0].shape}, mask shape: {mask_array.shape}")
+            script_masks[i] = np.asarray(mask_array, dtype=bool) # scan uses the bool mask directly, the image is just for display
+            gui.mod_masks[i] = Image.fromarray(script_masks[i].astype(np.uint8) * 255)
+        except Exception as e:
+            print(f"[ERROR] Mask script failed for channel {ttl_chans[i]}: {e}")
+            messagebox.showerror('Auto-Mask Error', f'Error in mask creation on  {ttl_chans[i]}: {e}')
+            return None
+
+    # load the processing as the preset masks for the second (real) acquisition
+    mod_idx = [i for i in ttl_chans if i in gui.mod_masks]
+    return run_scan(
+        ai_channels=channels,
+        galvo=galvo,
+        modulate=bool(mod_idx),
+        mod_do_chans=[ttl_chans[i] for i in mod_idx],
+        mod_masks=[script_masks.get(i, gui.mod_masks[i]) for i in mod_idx],
+    )
+
+
+def acquire_single(gui, scan, move_z=None):
     if move_z is not None:
         try:
             gui.zaber_stage.move_absolute_um(move_z)
@@ -126,70 +263,12 @@ def acquire_single(gui, channels, galvo, move_z=None, force_no_mask=False):
             return None
 
     try:
-        if gui.simulation_mode.get(): # :)
-            data_list = generate_data(len(channels), config=gui.config)
-            gui.root.after(0, display_data, gui, data_list)
-            return [convert(d) for d in data_list]
-        
-
-    
-        use_dynamic_mask = hasattr(gui, 'mod_scripts') and any(
-            gui.mod_enabled_vars[i].get() and i in gui.mod_scripts
-            for i in range(len(gui.mod_enabled_vars))
-        )
-        if force_no_mask: 
-            use_dynamic_mask = False
-        mod_do_chans = []
-        mod_masks = []
-
-        if use_dynamic_mask:
-            data_list = run_scan(
-                ai_channels=channels,
-                galvo=galvo,
-                modulate=False,
-            )
-            converted = np.asarray([convert(d) for d in data_list])
-
-            # process the first acquisition
-            for i, enabled_var in enumerate(gui.mod_enabled_vars): 
-                if enabled_var.get() and i in gui.mod_scripts:
-                    try:
-                        mask_array = gui.mod_scripts[i](converted)
-                        if mask_array.shape != converted[0].shape:
-                            raise ValueError(f"Returned mask is the wrong size relative to input imgae shape. Input shape: {converted[0].shape}, mask shape: {mask_array.shape}")
-                        gui.mod_masks[i] = Image.fromarray(mask_array.astype(np.uint8) * 255)
-                    except Exception as e:
-                        print(f"[ERROR] Mask script failed for channel {gui.mod_ttl_channel_vars[i].get()}: {e}")
-                        messagebox.showerror('Auto-Mask Error', f'Error in mask creation on  {gui.mod_ttl_channel_vars[i].get()}: {e}')
-                        return None
-
-            # load the processing as the preset masks for the second (real) acquisition
-            for i, enabled_var in enumerate(gui.mod_enabled_vars): 
-                if enabled_var.get() and i in gui.mod_masks:
-                    ttl_var = gui.mod_ttl_channel_vars[i].get()
-                    mod_do_chans.append(ttl_var)
-                    mod_masks.append(gui.mod_masks[i])
-
-        elif not force_no_mask: # TODO: check if this is weird
-            if hasattr(gui, 'mod_enabled_vars') and hasattr(gui, 'mod_masks'):
-                for i, enabled_var in enumerate(gui.mod_enabled_vars):
-                    if enabled_var.get() and i in gui.mod_masks:
-                        ttl_var = gui.mod_ttl_channel_vars[i].get()
-                        mod_do_chans.append(ttl_var)
-                        mod_masks.append(gui.mod_masks[i])
-
-        data_list = run_scan(
-            ai_channels=channels,
-            galvo=galvo,
-            modulate=bool(mod_do_chans),
-            mod_do_chans=mod_do_chans,
-            mod_masks=mod_masks,
-        )
-
-        gui.root.after(0, display_data, gui, data_list)
-        return [convert(d) for d in data_list]
+        data_list = scan()
+        if data_list is None:
+            return None
 
-       
+        schedule_display(gui, data_list)
+        return data_list
 
     except Exception as e:
         reset_gui(gui)
@@ -198,45 +277,56 @@ def acquire_single(gui, channels, galvo, move_z=None, force_no_mask=False):
 
 
 
-def save_images(gui, images, filename):
-    if not images:
+TIFF_WRITE_BUFFER = 2 * 1024 * 1024 # large stacks on network drives are dominated by small write syscalls otherwise
+
+def write_tiff_stack(path, stack, channel_names):
+    # the whole (steps, channels, y, x) stack goes into one ImageJ hyperstack in a single write
+    with open(path, 'wb', buffering=TIFF_WRITE_BUFFER) as f:
+        tifffile.imwrite(
+            f, stack,
+            imagej=True,
+            metadata={'axes': 'TCYX', 'Labels': channel_names * len(stack)},
+            compression='zlib',
+            compressionargs={'level': 1}
+        )
+
+def save_images(gui, frames, filename):
+    # runs on the io pool, so the dialogs and the progress label are handed to the tk thread instead of called here
+    if len(frames) == 0:
+        return
+    try:
+        new_filename = write_unique(gui, frames, filename)
+    except Exception as e:
+        gui.tk_calls.put((messagebox.showerror, ('Save Error', f'Could not save {filename}:\n{e}')))
         return
+
+    gui.tk_calls.put((messagebox.showinfo, ('Done', f"Saved frames:\n{new_filename}")))
+    gui.tk_calls.put((gui.progress_var.set, (f'(0/{len(frames)})',)))
+
+def write_unique(gui, frames, filename):
     dirpath = os.path.dirname(filename)
     if dirpath:
         os.makedirs(dirpath, exist_ok=True)
 
     base, ext = os.path.splitext(filename)
-    num_channels = len(images[0])
-    saved_fnames = []
+    num_channels = frames.shape[1]
+    channel_names = []
 
     for ch_idx in range(num_channels):
-        channel_frames = [frame[ch_idx] for frame in images]
-        counter = 1
-
         if 'channel_names' in gui.config and ch_idx < len(gui.config['channel_names']):
-            channel_suffix = gui.config['channel_names'][ch_idx]
+            channel_names.append(gui.config['channel_names'][ch_idx])
         elif ch_idx < len(gui.config['ai_chans']):
-            channel_suffix = gui.config['ai_chans'][ch_idx]
-        else:
-            channel_suffix = f"chan{ch_idx}"
-
-        new_filename = f"{base}_{channel_suffix}{ext}"
-        while os.path.exists(new_filename):
-            new_filename = f"{base}_{channel_suffix}_{counter}{ext}"
-            counter += 1
-
-        if len(channel_frames) > 1:
-            channel_frames[0].save(
-                new_filename,
-                save_all=True,
-                append_images=channel_frames[1:],
-                format='TIFF'
-            )
+            channel_names.append(gui.config['ai_chans'][ch_idx])
         else:
-            channel_frames[0].save(new_filename, format='TIFF')
-
-        saved_fnames.append(new_filename)
-
-    msg = "Saved frames:\n" + "\n".join(saved_fnames)
-    messagebox.showinfo('Done', msg)
-    gui.progress_label.config(text=f'(0/{len(images)})')
+            channel_names.append(f"chan{ch_idx}")
+
+    # one directory read instead of a stat per candidate name, normcase keeps the windows case-insensitive behaviour of exists()
+    existing = {os.path.normcase(name) for name in os.listdir(dirpath or '.')}
+    new_filename = filename
+    counter = 1
+    while os.path.normcase(os.path.basename(new_filename)) in existing:
+        new_filename = f"{base}_{counter}{ext}"
+        counter += 1
+
+    write_tiff_stack(new_filename, frames, channel_names)
+    return new_filename
@@ -3,7 +3,6 @@ import math
 import tkinter as tk
 from mpl_toolkits.axes_grid1 import make_axes_locatable
 from matplotlib.colors import ListedColormap
-from PIL import Image
 
 def create_axes(gui, n_channels):
     gui.fig.clf()
@@ -168,16 +167,10 @@ def display_data(gui, data_list):
             for idx, enabled_var in enumerate(getattr(gui, "mod_enabled_vars", [])):
                 if not enabled_var.get() or idx not in gui.mod_masks:
                     continue
-                mask_img = gui.mod_masks[idx]
-                mask_arr = np.array(mask_img.convert('L')) > 0
-                if mask_arr.shape != (ny, nx):
-                    mask_arr = np.array(mask_img.resize((nx, ny), Image.NEAREST)) > 0
+                mask_arr = mask_to_grid(gui.mod_masks[idx], ny, nx)
                 color = overlay_colors[idx % len(overlay_colors)]
                 rgba_mask = np.zeros((ny, nx, 4), dtype=np.float32)
-                rgba_mask[..., 0] = color[0] * mask_arr
-                rgba_mask[..., 1] = color[1] * mask_arr
-                rgba_mask[..., 2] = color[2] * mask_arr
-                rgba_mask[..., 3] = color[3] * mask_arr
+                rgba_mask[mask_arr] = color
 
                 overlay = ax_main.imshow(rgba_mask,
                                          extent=[x_extent[0], x_extent[-1], y_extent[-1], y_extent[0]],
@@ -191,6 +184,33 @@ def display_data(gui, data_list):
     gui.canvas.draw_idle()
 
 
+def mask_to_grid(mask_img, ny, nx):
+    # bool (ny, nx) mask from a mask image, no convert() copy for the usual 'L' masks
+    mask_arr = np.asarray(mask_img if mask_img.mode in ('L', '1') else mask_img.convert('L')) > 0
+    h, w = mask_arr.shape
+    if (h, w) != (ny, nx):
+        # nearest neighbour on the bool array itself (pixel-center sampling, like Image.NEAREST up to exact ties)
+        rows = ((np.arange(ny) + 0.5) * h / ny).astype(np.intp)
+        cols = ((np.arange(nx) + 0.5) * w / nx).astype(np.intp)
+        mask_arr = mask_arr[rows[:, None], cols]
+    return mask_arr
+
+
+def schedule_display(gui, data_list):
+    # called from the acquisition thread, only the newest frame is kept so a slow redraw never stalls the DAQ
+    gui.data = data_list
+    gui.latest_display = data_list
+    if not gui.display_pending:
+        gui.display_pending = True
+        gui.root.after(0, render_latest, gui)
+
+def render_latest(gui):
+    gui.display_pending = False
+    data_list = gui.latest_display
+    if data_list is not None:
+        display_data(gui, data_list)
+
+
 def on_image_click(gui, event):
     if str(gui.toolbar.mode) in ["zoom rect", "pan/zoom"]:
         return
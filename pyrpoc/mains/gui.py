@@ -3,7 +3,8 @@ from tkinter import ttk, messagebox, filedialog
 import numpy as np
 from matplotlib.figure import Figure
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
-import threading, os
+import threading, os, queue
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from PIL import Image
 import sys
@@ -56,6 +57,7 @@ class GUI:
         self.root.configure(bg=self.bg_color)
 
         self.simulation_mode = tk.BooleanVar(value=True)
+        self.simulation_mode.trace_add('write', self.mark_params_dirty)
         self.running = False
         self.acquiring = False
         self.collapsed = False
@@ -96,6 +98,16 @@ class GUI:
         self.slice_x = []
         self.slice_y = []
         self.data = None
+        self.latest_display = None
+        self.display_pending = False
+        self.galvo_cache = None
+        self.config_dirty = True # set when device/ai channels change so acquisition rebuilds its channel list
+        self.params_dirty = True # set by traces on the scan-affecting tk vars so acquisition only rebuilds its scan when needed
+        self.io_pool = ThreadPoolExecutor(max_workers=min(os.cpu_count() or 1, 4)) # frame conversion
+        self.save_pool = ThreadPoolExecutor(max_workers=1) # tiff saving, one at a time so write_unique never races itself or starves io_pool
+        self.pending_saves = []
+        self.tk_calls = queue.SimpleQueue() # worker threads never touch tk themselves, poll_tk_calls runs these on the tk thread
+        self.closing = False
 
         self.main_frame = ttk.Frame(self.root)
         self.main_frame.pack(fill="both", expand=True)
@@ -131,6 +143,7 @@ class GUI:
         self.root.after(100, lambda: self.paned.sashpos(0, 450))
         self.update_sidebar_visibility()
         self.root.after(500, self.update_sidebar_visibility)
+        self.root.after(100, self.poll_tk_calls)
 
         # self.welcome()
 
@@ -149,6 +162,18 @@ class GUI:
             "Use the sidebar to configure acquisition parameters, and make sure to correctly match the analog input/output channels."
         )
 
+    def poll_tk_calls(self):
+        # save dialogs etc. queued by worker threads, a worker calling into tk directly would block until this thread serviced it
+        while True:
+            try:
+                func, args = self.tk_calls.get_nowait()
+            except queue.Empty:
+                break
+            if not self.closing:
+                func(*args)
+        if not self.closing:
+            self.root.after(100, self.poll_tk_calls)
+
     def update_sidebar_visibility(self):
         panes = [child for child in self.sidebar.winfo_children() if hasattr(child, 'show')]
         visible = any(pane.show.get() for pane in panes)
@@ -263,7 +288,8 @@ class GUI:
         self.save_num_entry.insert(0, '1')
         self.save_num_entry.grid(row=0, column=1, sticky='w', padx=(5, 5))
 
-        self.progress_label = ttk.Label(self.io_frame, text='(0/0)', font=('Calibri', 12, 'bold'))
+        self.progress_var = tk.StringVar(value='(0/0)')
+        self.progress_label = ttk.Label(self.io_frame, textvariable=self.progress_var, font=('Calibri', 12, 'bold'))
         self.progress_label.grid(row=0, column=2, padx=5)
 
         self.path_frame = ttk.Frame(self.control_frame)
@@ -762,7 +788,7 @@ class GUI:
         for i in range(np.shape(self.data)[0]):
             plane = self.data[i]
             norm = (plane / np.max(plane) * 255).astype(np.uint8)
-            images.append(Image.fromarray(norm).convert("RGB"))
+            images.append(Image.fromarray(norm)) # already 'L', the editor only reads these back as grayscale
 
         launch_pyqt_editor(preloaded_images=images, channel_names=self.config["channel_names"])
 
@@ -788,6 +814,7 @@ class GUI:
 
         for i in range(num):
             ttl_var = tk.StringVar(value=f"port0/line{4+i}")
+            ttl_var.trace_add('write', self.mark_params_dirty)
             self.mod_ttl_channel_vars.append(ttl_var)
 
             ttl_entry = ttk.Entry(self.mod_channels_frame, textvariable=ttl_var, width=12)
@@ -819,9 +846,14 @@ class GUI:
             def make_callback(idx=i):
                 return lambda *_: self.refresh_display_masks()
             enabled_var.trace_add('write', make_callback(i))
+            enabled_var.trace_add('write', self.mark_params_dirty)
 
+        self.params_dirty = True
         self.mod_channels_frame.update_idletasks()
 
+    def mark_params_dirty(self, *_):
+        self.params_dirty = True
+
     def refresh_display_masks(self):
         if self.show_mask_var.get() and hasattr(self, "data") and self.data:
             display.display_data(self, self.data)
@@ -864,6 +896,8 @@ class GUI:
             messagebox.showerror("Load Error", f"Failed to load mask or script:\n{e}")
             return  # no UI update for failed loading
 
+        self.params_dirty = True
+
         self.mod_mask_vars[idx].set(filename)
         entry_widget = self.mod_mask_entries[idx]
         entry_widget.configure(foreground="green", font=('Calibri', 11, 'bold'))
@@ -958,6 +992,7 @@ class GUI:
                 elif key == 'device':
                     if value != self.config[key]:
                         self.config[key] = value
+                        self.config_dirty = True
 
                 elif key in ['amp_x', 'amp_y', 'offset_x', 'offset_y', 'rate', 'dwell']:
                     float_val = float(value)
@@ -980,7 +1015,10 @@ class GUI:
                 return
 
         try:
-            self.config["ai_chans"] = [var.get().strip() for var in self.input_ai_vars]
+            ai_chans = [var.get().strip() for var in self.input_ai_vars]
+            if ai_chans != self.config.get("ai_chans"):
+                self.config["ai_chans"] = ai_chans
+                self.config_dirty = True
             self.config["channel_names"] = [var.get().strip() for var in self.input_name_vars]
 
             for label, var in zip(self.config["channel_names"], self.input_fixed_cb_vars):
@@ -1085,8 +1123,14 @@ class GUI:
 
 
     def close(self):
+        self.closing = True # queued save dialogs are dropped from here on
         self.running = False
         self.zaber_stage.disconnect()
+        # let any in-flight save finish before tearing down, safe to block here since the saves never call into tk
+        for future in self.pending_saves:
+            future.exception()
+        self.save_pool.shutdown(wait=True)
+        self.io_pool.shutdown(wait=True)
         self.root.quit()
         self.root.destroy()
         os._exit(0)
\ No newline at end of file
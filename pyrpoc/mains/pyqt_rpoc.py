@@ -2,7 +2,6 @@ import sys
 import numpy as np
 from PIL import Image, ImageDraw 
 import cv2 
-import random
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QPushButton, QFileDialog,
     QGraphicsView, QGraphicsScene, QGraphicsEllipseItem,
@@ -11,10 +10,39 @@ from PyQt5.QtWidgets import (
     QAction, QDialog
 )
 from PyQt5.QtGui import QPixmap, QPainterPath, QPen, QBrush, QPainter, QFont, QColor, QPalette, QImage
-from PyQt5.QtCore import Qt, QPointF, QRectF, QPoint, QVariant
+from PyQt5.QtCore import Qt, QPointF, QRectF, QPoint, QVariant, QTimer
 from superqt import QRangeSlider
 
+def points_in_rois(px, py, edges):
+    # even-odd ray cast of every point against every roi edge at once, returns True where a point is in any roi.
+    # edges is (x0, y0, x1, y1, starts) with all rois concatenated, starts marks where each roi's edges begin
+    x0, y0, x1, y1, starts = edges
+    px = np.asarray(px, dtype=np.float64).reshape(-1, 1)
+    py = np.asarray(py, dtype=np.float64).reshape(-1, 1)
+    if len(starts) == 0:
+        return np.zeros(px.shape[0], dtype=bool)
+    straddles = (y0 > py) != (y1 > py)
+    with np.errstate(divide='ignore', invalid='ignore'): # horizontal edges never straddle, their nan/inf gets masked out
+        x_cross = x0 + (py - y0) * (x1 - x0) / (y1 - y0)
+    crossings = (straddles & (px < x_cross)).view(np.uint8)
+    counts = np.add.reduceat(crossings, starts, axis=1, dtype=np.int32)
+    return (counts & 1).any(axis=1)
+
+def polygon_centroid(xs, ys):
+    # area weighted (shoelace) centroid, a plain vertex mean gets pulled toward wherever the freehand points bunch up
+    xn, yn = np.roll(xs, -1), np.roll(ys, -1)
+    cross = xs * yn - xn * ys
+    area = 0.5 * cross.sum()
+    if abs(area) < 1e-9: # degenerate (line/point), fall back to the vertex mean
+        return xs.mean(), ys.mean()
+    cx = ((xs + xn) * cross).sum() / (6 * area)
+    cy = ((ys + yn) * cross).sum() / (6 * area)
+    return cx, cy
+
 class ImageViewer(QGraphicsView):
+    # fixed palette, hues stepped by ~the golden angle so neighbouring roi numbers get clearly different colors
+    ROI_PALETTE = [QColor.fromHsv((i * 137) % 360, 180, 220) for i in range(64)]
+
     def __init__(self, scene, roi_table, params, main_window, update_mask_cb=None, update_label_cb=None):
         super().__init__(scene)
         self.setRenderHints(self.renderHints() | QPainter.Antialiasing)
@@ -40,6 +68,9 @@ class ImageViewer(QGraphicsView):
         self.show_labels = True  # toggled by N
         self.roi_items = []      # list of QGraphicsPathItem
         self.roi_label_items = []# parallel list of QGraphicsTextItem
+        self.roi_vertices = []   # parallel list of (n, 2) float arrays, what the hit tests run against
+        self.roi_edges = None
+        self.rebuild_roi_edges()
         self.path_pen = QPen(Qt.red, 2, Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin)
         self.roi_opacity = 0.4
 
@@ -89,17 +120,18 @@ class ImageViewer(QGraphicsView):
 
                 new_index = len(self.roi_items) + 1
                 roi_item = self.scene().addPath(self.current_path)
-                color = self.get_random_color()
+                color = self.get_roi_color()
                 roi_item.setPen(QPen(color, 2))
                 roi_item.setBrush(QBrush(color))
                 roi_item.setOpacity(self.roi_opacity if self.show_rois else 0.0)
 
                 self.roi_items.append(roi_item)
+                self.add_roi_vertices([(p.x(), p.y()) for p in self.current_points])
 
-                roi_label = self.create_roi_label(new_index, self.current_points)
+                roi_label = self.create_roi_label(new_index, self.roi_vertices[-1])
                 self.roi_label_items.append(roi_label)
 
-                self.add_roi_to_table(new_index, self.current_points)
+                self.add_roi_to_table(new_index, self.roi_vertices[-1])
 
                 self.main_window.roi_channel_flags.append(self.main_window.image_visibility.copy())  # FIXED
 
@@ -119,27 +151,62 @@ class ImageViewer(QGraphicsView):
             self.viewport().setCursor(Qt.ArrowCursor)
         super().mouseReleaseEvent(event)
 
+    def add_roi_vertices(self, points):
+        self.roi_vertices.append(np.asarray(points, dtype=np.float64).reshape(-1, 2))
+        self.rebuild_roi_edges()
+
+    def remove_roi_vertices(self, i):
+        self.roi_vertices.pop(i)
+        self.rebuild_roi_edges()
+
+    def rebuild_roi_edges(self):
+        # flatten every roi into one set of edge arrays, only redone when an roi is added or removed
+        polys = [v for v in self.roi_vertices if len(v)]
+        if not polys:
+            empty = np.empty(0)
+            self.roi_edges = (empty, empty, empty, empty, np.empty(0, dtype=np.intp))
+            self.roi_spans = np.empty((0, 2), dtype=np.intp)
+            self.roi_bboxes = np.empty((0, 4))
+            return
+        lengths = np.array([len(v) for v in polys])
+        starts = np.concatenate(([0], np.cumsum(lengths[:-1])))
+        verts = np.concatenate(polys)
+        nxt = np.concatenate([np.roll(v, -1, axis=0) for v in polys]) # closing edge wraps back to each roi's first point
+        self.roi_edges = (verts[:, 0], verts[:, 1], nxt[:, 0], nxt[:, 1], starts)
+        self.roi_spans = np.stack([starts, starts + lengths], axis=1)
+        self.roi_bboxes = np.array([np.concatenate((v.min(axis=0), v.max(axis=0))) for v in polys]) # xmin, ymin, xmax, ymax
+
     def is_inside_any_roi(self, point):
-        for roi_item in self.roi_items:
-            if roi_item.contains(point):
+        return self.is_inside_any_roi_xy(point.x(), point.y())
+
+    def is_inside_any_roi_xy(self, px, py):
+        # cheap bbox rejection first, only rois whose box contains the point get the full ray cast
+        bb = self.roi_bboxes
+        near = np.flatnonzero((px >= bb[:, 0]) & (px <= bb[:, 2]) & (py >= bb[:, 1]) & (py <= bb[:, 3]))
+        x0, y0, x1, y1, _ = self.roi_edges
+        for i in near:
+            s, e = self.roi_spans[i]
+            if points_in_rois(px, py, (x0[s:e], y0[s:e], x1[s:e], y1[s:e], [0]))[0]:
                 return True
         return False
 
     def find_boundary_point(self, p1, p2):
-        steps = 50
+        if not self.is_inside_any_roi(p2):
+            return p2
+
+        # bisect between the outside p1 and the inside p2, 8 halvings puts lo within 1/256 of the segment from the edge
         x1, y1 = p1.x(), p1.y()
-        x2, y2 = p2.x(), p2.y()
-
-        last_outside = p1
-        for i in range(1, steps+1):
-            alpha = i / steps
-            x = x1 + alpha * (x2 - x1)
-            y = y1 + alpha * (y2 - y1)
-            candidate = QPointF(x, y)
-            if self.is_inside_any_roi(candidate):
-                return last_outside
-            last_outside = candidate
-        return p2
+        dx, dy = p2.x() - x1, p2.y() - y1
+        lo, hi = 0.0, 1.0
+        for _ in range(8):
+            mid = 0.5 * (lo + hi)
+            if self.is_inside_any_roi_xy(x1 + mid * dx, y1 + mid * dy):
+                hi = mid
+            else:
+                lo = mid
+        if lo == 0.0:
+            return p1
+        return QPointF(x1 + lo * dx, y1 + lo * dy)
 
     def mouseMoveEvent(self, event):
         if self.drawing and self.current_path is not None:
@@ -163,12 +230,7 @@ class ImageViewer(QGraphicsView):
 
         super().mouseMoveEvent(event)
 
-    def create_roi_label(self, roi_index, points):
-        xs = [p.x() for p in points]
-        ys = [p.y() for p in points]
-        cx = sum(xs) / len(xs)
-        cy = sum(ys) / len(ys)
-
+    def create_roi_label(self, roi_index, vertices):
         label_text = f"{roi_index}"
         label_item = QGraphicsTextItem(label_text)
         
@@ -176,14 +238,18 @@ class ImageViewer(QGraphicsView):
         label_item.setFont(font)
         label_item.setDefaultTextColor(Qt.white)
 
-        text_rect = label_item.boundingRect()
-        label_item.setPos(cx - text_rect.width() / 2, cy - text_rect.height() / 2)
+        self.place_roi_label(label_item, vertices)
         label_item.setZValue(999)
 
         label_item.setVisible(self.show_rois and self.show_labels)
         self.scene().addItem(label_item)
         return label_item
 
+    def place_roi_label(self, label_item, vertices):
+        cx, cy = polygon_centroid(vertices[:, 0], vertices[:, 1])
+        text_rect = label_item.boundingRect()
+        label_item.setPos(cx - text_rect.width() / 2, cy - text_rect.height() / 2)
+
     def keyPressEvent(self, event):
         if event.key() == Qt.Key_M:
             self.show_rois = not self.show_rois
@@ -204,7 +270,7 @@ class ImageViewer(QGraphicsView):
         for lbl in self.roi_label_items:
             lbl.setVisible(self.show_rois and self.show_labels)
 
-    def add_roi_to_table(self, idx, points):
+    def add_roi_to_table(self, idx, vertices):
         row = self.roi_table.rowCount()
         self.roi_table.insertRow(row)
 
@@ -212,7 +278,12 @@ class ImageViewer(QGraphicsView):
         item.setData(Qt.UserRole, idx)
         self.roi_table.setItem(row, 0, item)
 
-        coords_str = ', '.join([f'({p.x():.1f}, {p.y():.1f})' for p in points])
+        # freehand rois have hundreds of points and the cell is unreadable past a few, so only show the ends
+        fmt = lambda pts: ', '.join(f'({x:.1f}, {y:.1f})' for x, y in pts)
+        if len(vertices) > 16:
+            coords_str = f'{fmt(vertices[:3])}, ..., {fmt(vertices[-3:])} [{len(vertices)} pts]'
+        else:
+            coords_str = fmt(vertices)
         self.roi_table.setItem(row, 1, QTableWidgetItem(coords_str))
 
         low_item = QTableWidgetItem(str(self.params.low))
@@ -222,11 +293,8 @@ class ImageViewer(QGraphicsView):
 
         self.roi_table.setItem(row, 4, QTableWidgetItem(str(0.5)))
 
-    def get_random_color(self):
-        r = random.randint(50, 255)
-        g = random.randint(50, 255)
-        b = random.randint(50, 255)
-        return QColor(r, g, b)
+    def get_roi_color(self):
+        return self.ROI_PALETTE[len(self.roi_items) % len(self.ROI_PALETTE)]
 
 def set_dark_theme(app):
     app.setStyle("Fusion")
@@ -285,6 +353,12 @@ class MainWindow(QMainWindow):
         preview_action.triggered.connect(self.preview_mask)
         self.addAction(preview_action)
 
+        # slider drags fire far faster than a redraw is useful, coalesce them into one update per ~frame
+        self.update_timer = QTimer(self)
+        self.update_timer.setSingleShot(True)
+        self.update_timer.setInterval(16)
+        self.update_timer.timeout.connect(self.update_displayed_image)
+
         self.threshold_slider = QRangeSlider(Qt.Horizontal)
         self.threshold_slider.setMinimum(0)
         self.threshold_slider.setMaximum(255)
@@ -313,7 +387,7 @@ class MainWindow(QMainWindow):
 
         if preloaded_images:
             for i, pil_image in enumerate(preloaded_images):
-                img = np.array(pil_image.convert("L"))  # grayscale per channel
+                img = np.array(pil_image if pil_image.mode == "L" else pil_image.convert("L"))  # grayscale per channel, no extra convert copy when it already is
                 self.image_layers.append(img)
                 self.image_visibility.append(True)
 
@@ -324,6 +398,17 @@ class MainWindow(QMainWindow):
                 self.toggle_layout.addWidget(checkbox)
         self.roi_channel_flags = []  
 
+        # display buffers, the channel images never change size so these get filled in place on every redraw
+        if self.image_layers:
+            shape = self.image_layers[0].shape + (3,)
+            self.display_acc = np.empty(shape, dtype=np.uint16)
+            self.display_channel = np.empty(shape, dtype=np.uint8)
+            self.display_buf = np.empty(shape, dtype=np.uint8)
+            # qimage wraps display_buf's memory directly, so refilling the buffer is all a redraw needs. the buffer lives on self
+            # for as long as the window does, which keeps the pointer valid
+            h, w = self.image_layers[0].shape
+            self.display_qimage = QImage(self.display_buf.data, w, h, 3 * w, QImage.Format_RGB888)
+
         self.image_scene = QGraphicsScene()
         self.image_item = self.image_scene.addPixmap(QPixmap())  
         self.image_view = ImageViewer(self.image_scene, self.roi_table, self.params, self)
@@ -424,15 +509,16 @@ class MainWindow(QMainWindow):
                     path.lineTo(qpt)
             path.closeSubpath()
 
-            color = self.image_view.get_random_color()
+            color = self.image_view.get_roi_color()
             roi_item = self.image_scene.addPath(path, QPen(color, 2), QBrush(color))
             roi_item.setOpacity(self.image_view.roi_opacity if self.image_view.show_rois else 0)
             self.image_view.roi_items.append(roi_item)
+            self.image_view.add_roi_vertices(contour.reshape(-1, 2))
 
-            label_item = self.image_view.create_roi_label(n_rois + 1, points)
+            label_item = self.image_view.create_roi_label(n_rois + 1, self.image_view.roi_vertices[-1])
             self.image_view.roi_label_items.append(label_item)
 
-            self.image_view.add_roi_to_table(n_rois + 1, points)
+            self.image_view.add_roi_to_table(n_rois + 1, self.image_view.roi_vertices[-1])
             self.roi_channel_flags.append(self.image_visibility.copy())
             n_rois += 1
 
@@ -441,24 +527,21 @@ class MainWindow(QMainWindow):
 
 
     def set_preloaded_image(self, pil_image):
-        pil_image = pil_image.convert("RGB")
-        img_array = np.array(pil_image)
-
-        self.original_rgb_img = img_array
-        self.loaded_img = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)  
+        # only the grayscale version is ever used, so don't inflate single channel images to rgb and back
+        if pil_image.mode != "L":
+            pil_image = pil_image.convert("L")
+        self.loaded_img = np.array(pil_image)
 
         self.update_displayed_image()  # apply current thresholds for display
 
     def load_image(self):
         file_path, _ = QFileDialog.getOpenFileName(self, 'Open Image', '', 'Images (*.png *.jpg *.bmp)')
         if file_path:
-            img_array = cv2.imread(file_path)
+            img_array = cv2.imread(file_path, cv2.IMREAD_GRAYSCALE) # decoded straight to gray, no bgr -> rgb -> gray
             if img_array is None:
                 return
-            img_array = cv2.cvtColor(img_array, cv2.COLOR_BGR2RGB)
 
-            self.original_rgb_img = img_array
-            self.loaded_img = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
+            self.loaded_img = img_array
             self.update_displayed_image()
 
     def update_displayed_image(self):
@@ -466,22 +549,25 @@ class MainWindow(QMainWindow):
             return
 
         height, width = self.image_layers[0].shape
-        rgb_overlay = np.zeros((height, width, 3), dtype=np.uint8)
         low, high = self.threshold_slider.value()
 
+        # the threshold/stretch only depends on the gray level, so work it out for the 256 levels once and index with the image
+        levels = np.arange(256, dtype=np.float32)
+        in_range = (levels >= low) & (levels <= high)
+        normalized = np.where(in_range, (np.clip(levels, low, high) - low) / max((high - low), 1), 0).astype(np.float32)
+
+        acc = self.display_acc # uint16, wide enough that overlapping channels saturate instead of wrapping
+        acc.fill(0)
         for i, (img, visible) in enumerate(zip(self.image_layers, self.image_visibility)):
             if not visible:
                 continue
-            color = np.array(self.image_colors[i])
-            mask = (img >= low) & (img <= high)
-            normalized = np.zeros_like(img, dtype=np.float32)
-            if np.any(mask):
-                clipped = np.clip(img.astype(np.float32), low, high)
-                normalized[mask] = (clipped[mask] - low) / max((high - low), 1)
-            channel_img = (normalized[..., None] * color).astype(np.uint8)
-            rgb_overlay = np.clip(rgb_overlay + channel_img, 0, 255)
-
-        qimage = QImage(rgb_overlay.data, width, height, 3 * width, QImage.Format_RGB888)
+            lut = (normalized[:, None] * np.array(self.image_colors[i])).astype(np.uint8)
+            np.take(lut, img, axis=0, out=self.display_channel)
+            acc += self.display_channel
+        np.minimum(acc, 255, out=acc)
+        np.copyto(self.display_buf, acc, casting='unsafe') # display_qimage sees this straight away
+
+        qimage = self.display_qimage
         self.image_item.setPixmap(QPixmap.fromImage(qimage))
         self.image_scene.setSceneRect(QRectF(qimage.rect()))
 
@@ -504,47 +590,35 @@ class MainWindow(QMainWindow):
         if roi_idx is None:
             return
 
-        self.roi_table.removeRow(row)
         viewer = self.image_view
+        # roi n lives at position n - 1 in the viewer lists (and roi_channel_flags), deletes renumber everything to keep that true
+        remove_i = roi_idx - 1
+        if not 0 <= remove_i < len(viewer.roi_items):
+            return
 
-        label_to_remove = None
-        roi_to_remove = None
-        remove_i = None
-        for i, lbl in enumerate(viewer.roi_label_items):
-            if lbl.toPlainText() == str(roi_idx):
-                label_to_remove = lbl
-                roi_to_remove = viewer.roi_items[i]
-                remove_i = i
-                break
-
-        if remove_i is not None:
-            viewer.scene().removeItem(roi_to_remove)
-            viewer.scene().removeItem(label_to_remove)
-            viewer.roi_items.pop(remove_i)
-            viewer.roi_label_items.pop(remove_i)
-
-        # relabel the remaining rois so they match table order
-        for i, (roi, label) in enumerate(zip(viewer.roi_items, viewer.roi_label_items)):
-            idx = i + 1  
-            label.setPlainText(str(idx))
-
-            path = roi.path()
-            poly = path.toSubpathPolygons()[0]
-            cx = sum(p.x() for p in poly) / len(poly)
-            cy = sum(p.y() for p in poly) / len(poly)
-            text_rect = label.boundingRect()
-            label.setPos(cx - text_rect.width() / 2, cy - text_rect.height() / 2)
-
-        # rebuild table
-        viewer.roi_table.setRowCount(0)
-        for i, roi in enumerate(viewer.roi_items):
-            path = roi.path()
-            points = path.toSubpathPolygons()[0]
-            viewer.add_roi_to_table(i + 1, points)
+        self.roi_table.removeRow(row)
+        viewer.scene().removeItem(viewer.roi_items.pop(remove_i))
+        viewer.scene().removeItem(viewer.roi_label_items.pop(remove_i))
+        viewer.remove_roi_vertices(remove_i)
+        if remove_i < len(self.roi_channel_flags):
+            self.roi_channel_flags.pop(remove_i)
+
+        # only the rois after the deleted one change number
+        for i in range(remove_i, len(viewer.roi_label_items)):
+            label = viewer.roi_label_items[i]
+            label.setPlainText(str(i + 1))
+            viewer.place_roi_label(label, viewer.roi_vertices[i])
+
+        # renumber the remaining rows in place, keeps whatever thresholds/modulation were typed into them
+        for r in range(self.roi_table.rowCount()):
+            name_item = self.roi_table.item(r, 0)
+            if name_item:
+                name_item.setText(f'ROI {r + 1}')
+                name_item.setData(Qt.UserRole, r + 1)
 
     def on_threshold_changed(self, values):
-        self.update_displayed_image()   # update visible pixel
         self.params.low, self.params.high = values
+        self.update_timer.start()   # restarts while dragging, the redraw uses whatever the slider says when it fires
 
     def toggle_mask_visibility(self, visible):
         self.image_view.show_rois = visible
@@ -562,6 +636,8 @@ class MainWindow(QMainWindow):
         height, width = self.image_layers[0].shape
         final_mask = np.zeros((height, width), dtype=np.uint8)
 
+        # rois are applied in table order, a later roi overwrites earlier ones only where it passes its own thresholds.
+        # each one only touches its own bounding box instead of full-size masks
         for row in range(self.roi_table.rowCount()):
             idx_item = self.roi_table.item(row, 0)
             if not idx_item:
@@ -578,27 +654,32 @@ class MainWindow(QMainWindow):
             except:
                 continue
 
+            vertices = self.image_view.roi_vertices[roi_index - 1]
+            if not len(vertices):
+                continue
+
             active_channels = self.roi_channel_flags[roi_index - 1]
-            roi_path_item = self.image_view.roi_items[roi_index - 1]
-            polygons = roi_path_item.path().toSubpathPolygons()
-            if not polygons:
+            channel_imgs = [img for img, active in zip(self.image_layers, active_channels) if active]
+            if not channel_imgs: # no channels enabled, this roi can never set a pixel
                 continue
 
-            polygon = polygons[0]
-            pts = np.array([[int(p.x()), int(p.y())] for p in polygon], dtype=np.int32).reshape(-1, 1, 2)
-            roi_mask = np.zeros((height, width), dtype=np.uint8)
-            cv2.fillPoly(roi_mask, [pts], 255)
+            pts = vertices.astype(np.int32)
+            x0, y0 = np.maximum(pts.min(axis=0), 0)
+            x1, y1 = np.minimum(pts.max(axis=0) + 1, (width, height))
+            if x0 >= x1 or y0 >= y1:
+                continue
+            window = (slice(y0, y1), slice(x0, x1))
 
-            combined_mask = np.zeros((height, width), dtype=bool)
+            roi_mask = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+            cv2.fillPoly(roi_mask, [pts.reshape(-1, 1, 2)], 255, offset=(-int(x0), -int(y0)))
 
-            for i, (img, active) in enumerate(zip(self.image_layers, active_channels)):
-                if not active:
-                    continue
-                valid_range = (img >= low_val) & (img <= high_val)
-                combined_mask |= valid_range
+            combined_mask = np.zeros(roi_mask.shape, dtype=bool)
+            for img in channel_imgs:
+                win_img = img[window]
+                combined_mask |= (win_img >= low_val) & (win_img <= high_val)
 
             valid_pixels = combined_mask & (roi_mask == 255)
-            final_mask[valid_pixels] = int(mod_val * 255)
+            final_mask[window][valid_pixels] = int(mod_val * 255)
 
         return final_mask
 
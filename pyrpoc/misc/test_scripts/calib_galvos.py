@@ -1,5 +1,6 @@
 import nidaqmx
 from nidaqmx.constants import AcquisitionType
+from nidaqmx.stream_readers import AnalogSingleChannelReader
 import numpy as np
 import matplotlib.pyplot as plt
 from scipy.signal import find_peaks, TransferFunction, bode, step
@@ -21,15 +22,26 @@ config = {
     'save_plots': False,           
 }
 
+t_cache = {}
+
 def generate_waveform(test_type, duration, rate):
-    t = np.linspace(0, duration, int(duration * rate), endpoint=False)
+    # time axis only depends on (duration, rate), reuse it across sweeps
+    key = (duration, rate)
+    t = t_cache.get(key)
+    if t is None:
+        t = np.linspace(0, duration, int(duration * rate), endpoint=False)
+        t.setflags(write=False)
+        t_cache[key] = t
     if test_type == 'step':
         waveform = np.ones_like(t) * config['step_amplitude']
         waveform[:len(t)//2] = 0
     elif test_type == 'ramp':
         waveform = np.linspace(0, config['ramp_amplitude'], len(t))
     elif test_type == 'sine':
-        waveform = config['sine_amplitude'] * np.sin(2 * np.pi * config['sine_frequency'] * t)
+        waveform = np.empty_like(t)
+        np.multiply(t, 2 * np.pi * config['sine_frequency'], out=waveform)
+        np.sin(waveform, out=waveform)
+        waveform *= config['sine_amplitude']
     else:
         raise ValueError('Invalid test_type. Choose "step", "ramp", or "sinesine".')
     return t, waveform
@@ -62,8 +74,23 @@ def acquire_response(ao_channel, ai_channel, waveform, rate):
         ao_task.start()
         ao_task.wait_until_done()
         ai_task.wait_until_done()
-        response = ai_task.read(number_of_samples_per_channel=total_samples)
-    return np.array(response)
+        # read straight into a float64 array, no python list of samples to convert afterwards
+        response = np.empty(total_samples, dtype=np.float64)
+        reader = AnalogSingleChannelReader(ai_task.in_stream)
+        reader.read_many_sample(response, number_of_samples_per_channel=total_samples)
+    return response
+
+def read_scope_channel(scope, chan):
+    scope.write(f":DATA:SOURCE CH{chan}")
+    raw = scope.query_binary_values(":CURVe?", datatype='b', is_big_endian=True, container=np.ndarray)
+
+    # the fields we need by name in one round trip, the full :WFMPRE? field order changes between scope models
+    pre = scope.query(":WFMPRE:XINCR?;XZERO?;YMULT?;YOFF?;YZERO?").strip().split(';')
+    xincr, xzero, ymult, yoff, yzero = (float(f.split()[-1]) for f in pre) # split() drops a field header if HEADER is on
+
+    v = (raw.astype(np.float64) - yoff) * ymult + yzero
+    t = xzero + xincr * np.arange(len(v), dtype=np.float64)
+    return t, v
 
 def acquire_response_oscilloscope(
         ao_channel, 
@@ -84,7 +111,7 @@ def acquire_response_oscilloscope(
     scope.write(":ACQUIRE:STOPAFTER SEQ")
     scope.write(f":TRIGGER:MAIn:EDGE:SOURCE CH{trigger_chan}")
     scope.write(":TRIGGER:MAIn:EDGE:SLOpe RISing")
-    scope.write(":DATA:ENCdg ASCII")
+    scope.write(":DATA:ENCdg RIBinary") # signed binary block instead of a comma separated text float per sample
     scope.write(":DATA:WIDTH 1") 
     scope.write(f'CH{trigger_chan}:SCALE {trigger_chan_scale}')
     scope.write(f'CH{output_chan}:SCALE {output_chan_scale}')
@@ -106,25 +133,8 @@ def acquire_response_oscilloscope(
 
     time.sleep(0.5)
 
-    scope.write(f":DATA:SOURCE CH{trigger_chan}")
-    raw_data_ch1 = scope.query(":CURVe?")
-    ch1_values = raw_data_ch1.strip().split(',')
-    v_ch1 = np.array(ch1_values, dtype=float)
-
-    dt_ch1 = float(scope.query(":WFMPRE:XINCR?"))
-    t0_ch1 = float(scope.query(":WFMPRE:XZERO?"))
-    n_ch1 = len(v_ch1)
-    t_ch1 = t0_ch1 + dt_ch1 * np.arange(n_ch1)
-
-    scope.write(f":DATA:SOURCE CH{output_chan}")
-    raw_data_ch2 = scope.query(":CURVe?")
-    ch2_values = raw_data_ch2.strip().split(',')
-    v_ch2 = np.array(ch2_values, dtype=float)
-
-    dt_ch2 = float(scope.query(":WFMPRE:XINCR?"))
-    t0_ch2 = float(scope.query(":WFMPRE:XZERO?"))
-    n_ch2 = len(v_ch2)
-    t_ch2 = t0_ch2 + dt_ch2 * np.arange(n_ch2)
+    t_ch1, v_ch1 = read_scope_channel(scope, trigger_chan)
+    t_ch2, v_ch2 = read_scope_channel(scope, output_chan)
 
     return (t_ch1, v_ch1), (t_ch2, v_ch2)
 